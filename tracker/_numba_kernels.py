@@ -0,0 +1,29 @@
+#
+# Copyright Tristen Georgiou 2024
+#
+# optional numba compiled numeric kernels - numba isn't a required dependency and is slow to import, so this module is
+# only imported when a kernel is first needed, see trajgen.py for the pure numpy implementations
+from numba import njit, prange
+
+
+# no fastmath - the polys are in absolute time, so letting the compiler contract or reorder the Horner steps changes
+# the positions by ~1e-3 degrees, it must match the numpy implementation exactly
+@njit(cache=True, parallel=True)
+def eval_polys(coeffs, idx, times, out):
+    """
+    Evaluates the polys of the given segments at each time using Horner's method
+
+    :param coeffs: poly coefficients with shape (segments, dimensions, derivatives, coefficients), highest order first
+    :param idx: the segment index for each time
+    :param times: the times to evaluate the polys at
+    :param out: output array with shape (number of times, dimensions, derivatives)
+    """
+    for ii in prange(times.shape[0]):
+        seg = idx[ii]
+        time = times[ii]
+        for jj in range(coeffs.shape[1]):
+            for kk in range(coeffs.shape[2]):
+                val = 0.0
+                for ll in range(coeffs.shape[3]):
+                    val = val * time + coeffs[seg, jj, kk, ll]
+                out[ii, jj, kk] = val
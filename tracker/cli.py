@@ -0,0 +1,159 @@
+#
+# Copyright Tristen Georgiou 2024
+#
+import concurrent.futures
+import datetime
+import logging
+import pathlib
+from collections import ChainMap
+
+from skyfield.api import load, wgs84
+
+from tracker.model import load_config, load_tracking_config
+from tracker.utils import (
+    load_stations_data,
+    generate_trajectory,
+    init_telescope,
+    track_satellite,
+    load_active_data,
+    load_satellite,
+)
+
+log = logging.getLogger(__name__)
+
+COMMANDS = ["execute", "dryrun", "trajectory"]
+
+
+def _discard_telescope(hc_future: concurrent.futures.Future) -> None:
+    """
+    Cancel or collect a telescope that is being initialized in the background when it is no longer needed - logs any
+    error from initializing it and closes the serial port if it did connect.
+
+    :param hc_future: The future for the background init_telescope call.
+    """
+    if hc_future.cancel():
+        return
+
+    try:
+        hc = hc_future.result()
+    except Exception:
+        log.exception("Telescope initialization failed.")
+        return
+
+    log.info("Closing the telescope connection.")
+    hc.ser.close()
+
+
+def run(
+    satellite_config: pathlib.Path,
+    command: str,
+    config_path: pathlib.Path | None = None,
+    set_location: bool = False,
+    set_time: bool = False,
+    plot_dir: pathlib.Path | None = None,
+) -> int:
+    """
+    Run a satellite tracking command.
+
+    :param satellite_config: The path to the satellite tracking configuration file.
+    :param command: The command to execute, one of execute, dryrun, or trajectory.
+    :param config_path: The path to the configuration file - uses the default configuration file if not set.
+    :param set_location: Whether to set the telescope location using the configured latitude and longitude.
+    :param set_time: Whether to set the telescope time using the PC time and the configured timezone.
+    :param plot_dir: A directory to save the plots to instead of showing them.
+    :return: The exit code, 0 on success.
+    """
+    if command not in COMMANDS:
+        raise ValueError(f"Invalid command: {command}")
+
+    # load the base configuration
+    if config_path:
+        config = load_config(config_path)
+    else:
+        config = load_config()
+
+    # load the satellite tracking configuration
+    ts = load.timescale()
+    tracking_config = load_tracking_config(satellite_config)
+
+    # scan the data files for the satellite first so we only construct the one satellite we need - we fall back to
+    # parsing everything only to list the available satellites
+    satellite = load_satellite(ts, tracking_config.satellite)
+    if satellite is None:
+        log.error(
+            f"Could not find tracking information for '{tracking_config.satellite}'."
+        )
+        # view the 2 dictionaries as one rather than merging them
+        satellites = ChainMap(load_stations_data(ts), load_active_data(ts))
+        available = "\n".join(satellites.keys())
+        log.error(f"Available satellites: \n{available}")
+        return 1
+
+    log.info(
+        f"Loaded tracking information for '{tracking_config.satellite}', starting at {tracking_config.start} for "
+        f"{tracking_config.get_duration_seconds} seconds."
+    )
+
+    # define the observer location
+    obs_location = wgs84.latlon(config.location.latitude, config.location.longitude)
+    log.info(
+        f"Observer location: {obs_location.latitude.degrees:.5f}°, {obs_location.longitude.degrees:.5f}°"
+    )
+
+    # get the current time in the timezone specified in the configuration
+    tz = config.datetime.zoneinfo
+    now = datetime.datetime.now(tz=tz)
+    log.info(f"Current time: {now.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+
+    # determine how long before tracking is set to begin
+    delta = tracking_config.start - now
+
+    # if its negative, exit if the command is execute
+    if command == "execute" and delta.total_seconds() < 0:
+        log.error("Tracking start time has already passed! Cannot execute.")
+        return 1
+
+    # figure out how many hours, minutes, and seconds until satellite pass begins
+    hours, remainder = divmod(delta.total_seconds(), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    log.info(
+        f"Satellite pass will begin in {hours:.0f} hours, {minutes:.0f} minutes, and {seconds:.0f} seconds."
+    )
+
+    is_trajectory = command == "trajectory"
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        # initialize the telescope in the background while the trajectory is generated, setting the location and time
+        # if the flags are set - the telescope commands still run one after the other since they share the serial port
+        if not is_trajectory:
+            hc_future = executor.submit(
+                init_telescope, config, set_location=set_location, set_time=set_time
+            )
+
+        # generate and plot the trajectory
+        try:
+            traj = generate_trajectory(
+                satellite,
+                obs_location,
+                tracking_config,
+                ts,
+                tz,
+                config.telescope.max_slew_rate,
+                is_trajectory,  # plot the trajectory if we are in trajectory mode
+                plot_dir,
+            )
+        except Exception:
+            if not is_trajectory:
+                _discard_telescope(hc_future)
+            raise
+
+        if is_trajectory:
+            log.info("Trajectory generated. Exiting.")
+            return 0
+
+        # wait for the telescope - this raises any error from initializing it
+        hc = hc_future.result()
+
+    # track the satellite - in dryryn mode it will sweep across the trajectory immediately
+    is_dryrun = command == "dryrun"
+    track_satellite(hc, traj, tracking_config, is_dryrun, plot_dir)
+    return 0
@@ -2,7 +2,7 @@
 # Copyright Tristen Georgiou 2024
 #
 import datetime
-import json
+import functools
 import logging
 import pathlib
 from typing import Self
@@ -22,13 +22,9 @@ class LocationConfig(BaseModel):
     longitude: float
 
     @model_validator(mode="after")
-    def check_latitude(self) -> Self:
+    def check_location(self) -> Self:
         if not -90 <= self.latitude <= 90:
             raise ValueError("Latitude must be between -90 and 90")
-        return self
-
-    @model_validator(mode="after")
-    def check_longitude(self) -> Self:
         if not -180 <= self.longitude <= 180:
             raise ValueError("Longitude must be between -180 and 180")
         return self
@@ -40,11 +36,15 @@ class DateTimeConfig(BaseModel):
     @model_validator(mode="after")
     def check_timezone(self) -> Self:
         try:
-            ZoneInfo(self.timezone)
+            _ = self.zoneinfo
         except ZoneInfoNotFoundError:
             raise ValueError(f"Invalid timezone: {self.timezone}")
         return self
 
+    @functools.cached_property
+    def zoneinfo(self) -> ZoneInfo:
+        return ZoneInfo(self.timezone)
+
 
 class TelescopeConfig(BaseModel):
     comport: str
@@ -91,8 +91,7 @@ def load_config(path: pathlib.Path = DEFAULT_CONFIG_FILE) -> Config:
     :return: A Config object.
     """
     log.info(f"Loading configuration from {path}")
-    with path.open() as f:
-        return Config.model_validate(json.load(f))
+    return Config.model_validate_json(path.read_bytes())
 
 
 def load_tracking_config(path: pathlib.Path) -> TrackingConfig:
@@ -103,5 +102,4 @@ def load_tracking_config(path: pathlib.Path) -> TrackingConfig:
     :return: A TrackingConfig object.
     """
     log.info(f"Loading tracking configuration from {path}")
-    with path.open() as f:
-        return TrackingConfig.model_validate(json.load(f))
+    return TrackingConfig.model_validate_json(path.read_bytes())
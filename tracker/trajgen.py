@@ -3,12 +3,45 @@
 #
 # copied from https://github.com/tristeng/control/blob/master/trajectory/__init__.py
 import enum
+import functools
 import logging
+import math
 
 import numpy as np
 import sympy as sp
 
 
+def eval_polys(coeffs, idx, times, out):
+    """
+    Evaluates the polys of the given segments at each time using Horner's method
+
+    :param coeffs: poly coefficients with shape (segments, dimensions, derivatives, coefficients), highest order first
+    :param idx: the segment index for each time
+    :param times: the times to evaluate the polys at
+    :param out: output array with shape (number of times, dimensions, derivatives)
+    """
+    segcoeffs = coeffs[idx]
+    out[:] = 0.0
+    for kk in range(coeffs.shape[-1]):
+        out *= times[:, np.newaxis, np.newaxis]
+        out += segcoeffs[..., kk]
+
+
+@functools.cache
+def _load_jit_eval_polys():
+    """
+    Returns the numba compiled version of eval_polys, or None if numba isn't installed - numba takes a few hundred ms
+    to import, so it is only imported the first time it's used
+
+    :return: the compiled function or None
+    """
+    try:
+        from tracker._numba_kernels import eval_polys as jit_eval_polys
+    except ImportError:
+        return None
+    return jit_eval_polys
+
+
 class TrajectoryType(enum.Enum):
     VELOCITY = 2
     ACCELERATION = 4
@@ -41,8 +74,24 @@ class MininumTrajectory:
         pop = crac.diff(t)
 
         self.eqs = [pos, vel, acc, jerk, snap, crac, pop]
+
+        # numeric form of eqs used to build the system - row d has the constant and power of t for each coefficient in
+        # the d-th time derivative of position, e.g. d/dt of t^3 is 3t^2
+        self.eqfactors = np.array(
+            [
+                [math.perm(ii, dd) for ii in range(numcoeffs)]
+                for dd in range(len(self.eqs))
+            ],
+            dtype=float,
+        )
+        self.eqpowers = np.maximum(
+            np.arange(numcoeffs) - np.arange(len(self.eqs))[:, np.newaxis], 0
+        )
+
         self.times = None
-        self.polys = None
+        self.segment_starts = None
+        self._polys = None
+        self.coeffs = None
         self.dims = None
         self.numderivatives = None
 
@@ -74,28 +123,42 @@ class MininumTrajectory:
             retval[ii] = list(reversed(coeffs))
         return retval
 
+    def derivative_coeffs_for_time(self, first, count, time):
+        """
+        Returns the same matrix as coeffs_for_time for consecutive time derivatives of position, but computes it
+        numerically instead of evaluating the sympy equations
+
+        :param first: the first time derivative, where 0 is position
+        :param count: the number of time derivatives
+        :param time: the time to evaluate at
+        :return: matrix with number of rows equal to count by number of coefficients
+        """
+        rows = slice(first, first + count)
+        return self.eqfactors[rows] * time ** self.eqpowers[rows]
+
     def generate(self, points, times, numderivatives=2):
         """
         Solves the minimum trajectory for the given points and times and caches the trajectory and its requested time
         derivates for later use
 
-        :param points: an ordered list of tuples represent points the trajectory will pass through
-        :param times: an ordered list of times corresponding to points, of when the trajectory should reach the point
+        :param points: an ordered array (or list of tuples) with a row for each point the trajectory will pass through
+        :param times: an ordered array (or list) of times corresponding to points, of when the trajectory should reach
+            the point
         :param numderivatives: the number of time derivatives to generate
         """
+        points = np.asarray(points, dtype=float)
+        times = np.asarray(times, dtype=float)
         if len(points) != len(times) or len(points) < 2:
             raise ValueError(
                 "Points and times must be lists of equal length greater than 2"
             )
 
-        for idx, starttime in enumerate(times[:-1]):
-            endtime = times[idx + 1]
-            if endtime <= starttime:
-                raise ValueError(
-                    "Times must be ordered from smallest to largest and cannot overlap"
-                )
+        if np.any(np.diff(times) <= 0):
+            raise ValueError(
+                "Times must be ordered from smallest to largest and cannot overlap"
+            )
 
-        self.dims = len(points[0])
+        self.dims = points.shape[1]
         logging.info(
             f"Generating trajectory using {len(points)} waypoints - waypoints have {self.dims} dimensions."
         )
@@ -104,26 +167,28 @@ class MininumTrajectory:
         )
         self.numderivatives = numderivatives
 
-        self.times = np.array(times)
+        self.times = times
+
+        # the start time of each segment - a time belongs to the last segment that starts at or before it
+        self.segment_starts = times[:-1]
 
         n = self.numcoeffs * (len(points) - 1)
         A = np.zeros((n, n))
 
-        # use the first point to figure out how many b vectors we need
-        b = [np.zeros((n, 1)) for _ in range(self.dims)]
+        # one column in b for each of the point dimensions
+        b = np.zeros((n, self.dims))
 
         # fill in equations for first segment - time derivatives of position are all equal to 0 at start time
         nextrow = 0
         numeqs = int((self.numcoeffs - 2) / 2)
-        equations = self.eqs[1 : 1 + numeqs]
-        A[nextrow : nextrow + numeqs, 0 : self.numcoeffs] = self.coeffs_for_time(
-            equations, times[0]
+        A[nextrow : nextrow + numeqs, 0 : self.numcoeffs] = (
+            self.derivative_coeffs_for_time(1, numeqs, times[0])
         )
         nextrow += numeqs
 
         # fill in equations for last segment - time derivatives of position are all equal to 0 at end time
-        A[nextrow : nextrow + numeqs, n - self.numcoeffs : n] = self.coeffs_for_time(
-            equations, times[-1]
+        A[nextrow : nextrow + numeqs, n - self.numcoeffs : n] = (
+            self.derivative_coeffs_for_time(1, numeqs, times[-1])
         )
         nextrow += numeqs
 
@@ -137,20 +202,17 @@ class MininumTrajectory:
             # start point
             col = idx * self.numcoeffs
 
-            A[nextrow : nextrow + 1, col : col + self.numcoeffs] = self.coeffs_for_time(
-                [self.eqs[0]], startt
+            A[nextrow : nextrow + 1, col : col + self.numcoeffs] = (
+                self.derivative_coeffs_for_time(0, 1, startt)
             )
-            for ii in range(len(points[0])):
-                b[ii][nextrow] = startp[ii]
+            b[nextrow] = startp
             nextrow += 1
 
             # end point
-            A[nextrow : nextrow + 1, col : col + self.numcoeffs] = self.coeffs_for_time(
-                [self.eqs[0]], endt
+            A[nextrow : nextrow + 1, col : col + self.numcoeffs] = (
+                self.derivative_coeffs_for_time(0, 1, endt)
             )
-            for ii in range(len(points[0])):
-                b[ii][nextrow] = endp[ii]
-
+            b[nextrow] = endp
             nextrow += 1
 
         # for all segments, except last...
@@ -159,48 +221,50 @@ class MininumTrajectory:
 
             # fill in required equations for time derivatives to ensure they are the same through the transition point
             numeqs = self.numcoeffs - 2
-            equations = self.eqs[1 : 1 + numeqs]
+            coeffs = self.derivative_coeffs_for_time(1, numeqs, endt)
             col = idx * self.numcoeffs
-            A[nextrow : nextrow + numeqs, col : col + self.numcoeffs] = (
-                self.coeffs_for_time(equations, endt)
-            )
+            A[nextrow : nextrow + numeqs, col : col + self.numcoeffs] = coeffs
             col += self.numcoeffs
 
             # negate endt coefficients since we move everything to the lhs
-            A[
-                nextrow : nextrow + numeqs, col : col + self.numcoeffs
-            ] = -self.coeffs_for_time(equations, endt)
+            A[nextrow : nextrow + numeqs, col : col + self.numcoeffs] = -coeffs
             nextrow += numeqs
 
-        # solve the system
-        x = [np.linalg.solve(A, b[ii]) for ii in range(len(b))]
+        # solve the system - x has the coefficients for each of the point dimensions in its columns
+        x = np.linalg.solve(A, b)
 
-        # polys will have rows corresponding to segments, columns corresponding to the point dimensions, and 3rd dim
-        # will contain the position poly and the number of requested time derivatives
-        self.polys = []
-        t = sp.symbols("t")
-        for ii in range(len(points) - 1):
-            col = []
-            offset = ii * self.numcoeffs
-            for jj in range(len(x)):
-                layer = [
-                    sp.Poly(
-                        reversed(
-                            x[jj][offset : offset + self.numcoeffs].transpose()[0]
-                        ),
-                        t,
-                    )
-                ]
-
-                # append on requested number of time derivatives as well
-                for kk in range(1, 1 + numderivatives):
-                    # take the time derivative of the previous poly
-                    layer.append(layer[kk - 1].diff(t))
-                col.append(layer)
-            self.polys.append(col)
+        # coeffs will have rows corresponding to segments, columns corresponding to the point dimensions, and 3rd dim
+        # will contain the position poly and the number of requested time derivatives - the poly coefficients are in
+        # the last dimension, highest order first and zero padded
+        numsegments = len(points) - 1
+        x = x.reshape(numsegments, self.numcoeffs, self.dims).transpose(0, 2, 1)
+        self.coeffs = np.zeros(
+            (numsegments, self.dims, numderivatives + 1, self.numcoeffs)
+        )
+        for kk in range(min(numderivatives + 1, self.numcoeffs)):
+            # the kk-th time derivative of t^i is i!/(i - kk)! t^(i - kk)
+            factors = [math.perm(ii, kk) for ii in range(kk, self.numcoeffs)]
+            self.coeffs[:, :, kk, kk:] = (x[:, :, kk:] * factors)[:, :, ::-1]
+
+        # the sympy polys are only built if they are used
+        self._polys = None
 
         logging.info(f"Finished trajectory generation using {len(points)} waypoints.")
 
+    @property
+    def polys(self):
+        """
+        The trajectory as sympy polys with rows corresponding to segments, columns corresponding to the point
+        dimensions, and a 3rd dim containing the position poly and the requested time derivatives
+        """
+        if self._polys is None and self.coeffs is not None:
+            t = sp.symbols("t")
+            self._polys = [
+                [[sp.Poly(list(poly), t) for poly in layer] for layer in col]
+                for col in self.coeffs
+            ]
+        return self._polys
+
     def getvalues(self, time):
         """
         Returns an array where rows corresponds to the number of dimensions in points, and columns corresponds to the
@@ -209,25 +273,29 @@ class MininumTrajectory:
         :param time: the time to evaluate the polys at
         :return: nump array
         """
-        if self.times is None or self.polys is None:
-            raise AssertionError("Please generate the trajectory first")
-
-        # find the correct poly index
-        if time < self.times[0]:
-            time = self.times[0]
+        # a batch of one uses the numeric coefficients rather than evaluating the sympy polys
+        return self.getvalues_batch([time])[0]
 
-        if time > self.times[-1]:
-            time = self.times[-1]
+    def getvalues_batch(self, times, jit=False):
+        """
+        Returns an array of values for each of the given times, where each entry matches the output of getvalues for
+        that time
 
-        idx = np.argwhere(self.times <= time)[-1][0]
+        :param times: the times to evaluate the polys at
+        :param jit: use the numba compiled evaluation if numba is installed - only worth it for large batches, since
+            the first call pays for importing numba
+        :return: numpy array with shape (number of times, number of dimensions, number of time derivatives + 1)
+        """
+        if self.segment_starts is None or self.coeffs is None:
+            raise AssertionError("Please generate the trajectory first")
 
-        # the last index time actually means we should use the previous poly
-        if idx >= len(self.polys):
-            idx = len(self.polys) - 1
+        # find the correct poly index for every time - the last index time uses the previous poly
+        times = np.clip(np.asarray(times, dtype=float), self.times[0], self.times[-1])
+        idx = np.searchsorted(self.segment_starts, times, side="right") - 1
 
-        retval = np.zeros((self.dims, self.numderivatives + 1))
-        for jj in range(retval.shape[0]):
-            for kk in range(retval.shape[1]):
-                retval[jj][kk] = self.polys[idx][jj][kk].eval(time)
+        # evaluate all the polys at once
+        retval = np.empty((len(times), self.dims, self.numderivatives + 1))
+        kernel = (_load_jit_eval_polys() if jit else None) or eval_polys
+        kernel(self.coeffs, idx, times, retval)
 
         return retval
@@ -2,12 +2,21 @@
 # Copyright Tristen Georgiou 2024
 #
 import datetime
+import email.utils
 import enum
+import functools
+import http
 import logging
+import mmap
+import os
 import pathlib
+import ssl
 import time
+import urllib.error
+import urllib.request
 import zoneinfo
 
+import certifi
 import numpy as np
 from nexstar_control.device import (
     NexStarHandControl,
@@ -15,14 +24,13 @@ from nexstar_control.device import (
     LongitudeDMS,
     TrackingMode,
 )
+from sgp4.api import Satrec
 from skyfield.api import load
-from skyfield.iokit import parse_tle_file
+from skyfield.nutationlib import iau2000b
 from skyfield.sgp4lib import EarthSatellite
-from skyfield.timelib import Timescale
+from skyfield.timelib import Time, Timescale
 from skyfield.toposlib import GeographicPosition
 
-import matplotlib.pyplot as plt
-
 from tracker.model import Config, TrackingConfig
 from tracker.trajgen import MininumTrajectory, TrajectoryType
 
@@ -33,6 +41,10 @@ STATIONS_FILE = DATA_DIR / "stations.tle"
 ACTIVE_FILE = DATA_DIR / "active.tle"
 CELESTRAK_URL = "https://celestrak.com/NORAD/elements/gp.php?FORMAT=tle&GROUP="
 MAX_DATA_AGE = 7.0  # days
+DOWNLOAD_TIMEOUT = 30.0  # seconds
+TRACKING_LUT_RATE = 100  # Hz - resolution of the trajectory used while tracking
+PLOT_OVERSAMPLING = 3  # trajectory samples plotted per input point
+UTC = zoneinfo.ZoneInfo("UTC")
 
 
 class CelestrakGroup(str, enum.Enum):
@@ -40,6 +52,62 @@ class CelestrakGroup(str, enum.Enum):
     ACTIVE = "active"
 
 
+def refresh_celestrak_cache(cache_path: pathlib.Path, group: CelestrakGroup) -> None:
+    """
+    Download data from Celestrak if the local cache file is missing or out of date. An out of date cache is refreshed
+    with a conditional request, so the data is only downloaded again if Celestrak has changed it.
+
+    :param cache_path: The path to the local cache file.
+    :param group: The Celestrak group to download.
+    """
+    cache_path = pathlib.Path(cache_path)
+    if cache_path.exists() and load.days_old(str(cache_path)) < MAX_DATA_AGE:
+        log.info("Data cache is up to date - no downloads required.")
+        return
+
+    # the ETag of the last download is kept beside the cache file
+    etag_path = cache_path.with_name(cache_path.name + ".etag")
+    headers = {}
+    if cache_path.exists():
+        headers["If-Modified-Since"] = email.utils.formatdate(
+            cache_path.stat().st_mtime, usegmt=True
+        )
+        if etag_path.exists():
+            headers["If-None-Match"] = etag_path.read_text().strip()
+
+    log.info("Downloading satellite data...")
+    request = urllib.request.Request(CELESTRAK_URL + group.value, headers=headers)
+
+    # verify against certifi's CA bundle like skyfield's downloader - some Python builds have no usable system bundle
+    context = ssl.create_default_context(cafile=certifi.where())
+    try:
+        with urllib.request.urlopen(
+            request, timeout=DOWNLOAD_TIMEOUT, context=context
+        ) as response:
+            data = response.read()
+            etag = response.headers.get("ETag")
+    except urllib.error.HTTPError as e:
+        with e:
+            if e.code != http.HTTPStatus.NOT_MODIFIED:
+                raise
+
+        # bump the modification time so the cache is considered up to date again
+        os.utime(cache_path)
+        log.info("Satellite data is unchanged - no downloads required.")
+        return
+
+    # write to a temporary file first so an interrupted download can't leave a partial cache file behind
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".download")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, cache_path)
+    if etag:
+        etag_path.write_text(etag)
+    else:
+        etag_path.unlink(missing_ok=True)
+    log.info("satellite data downloaded successfully.")
+
+
 def load_celestrak_data(
     timescale: Timescale, cache_path: pathlib.Path, group: CelestrakGroup
 ) -> dict[str, EarthSatellite]:
@@ -55,21 +123,206 @@ def load_celestrak_data(
     log.info(f"Loading satellite data for group {group.name}...")
 
     cache_path = str(cache_path)
-    url = CELESTRAK_URL + group.value
-    if not load.exists(cache_path) or load.days_old(cache_path) >= MAX_DATA_AGE:
-        log.info("Downloading satellite data...")
-        load.download(url, filename=cache_path)
-        log.info("satellite data downloaded successfully.")
-    else:
-        log.info("Data cache is up to date - no downloads required.")
+    mtime = _checked_celestrak_cache(cache_path, group)
 
-    with load.open(cache_path) as f:
-        stations = list(parse_tle_file(f, timescale))
+    # return a copy so callers can't modify the cached satellites
+    stations = dict(_parse_tle_cached(cache_path, mtime, timescale))
 
     log.info(
         f"Satellite data group {group.name} loaded successfully. Found {len(stations)} satellite(s)."
     )
-    return {sat.name: sat for sat in stations}
+    return stations
+
+
+@functools.lru_cache(maxsize=8)
+def _checked_celestrak_cache(cache_path: str, group: CelestrakGroup) -> float:
+    """
+    Refresh a local cache file once per process - later loads of the same group skip the age check and download
+    entirely. Call _checked_celestrak_cache.cache_clear() to check for new data again.
+
+    :param cache_path: The path to the local cache file.
+    :param group: The Celestrak group to download.
+    :return: The modification time of the cache file.
+    """
+    refresh_celestrak_cache(cache_path, group)
+    return os.path.getmtime(cache_path)
+
+
+@functools.lru_cache(maxsize=8)
+def _parse_tle_cached(
+    cache_path: str, mtime: float, timescale: Timescale
+) -> dict[str, EarthSatellite]:
+    """
+    Parse a TLE file - the results are cached by path and modification time so a file is only parsed once per process
+    until it is downloaded again.
+
+    :param cache_path: The path to the TLE file.
+    :param mtime: The modification time of the TLE file, only used as part of the cache key.
+    :param timescale: A Timescale object.
+    :return: A dictionary of EarthSatellite objects keyed by their name.
+    """
+    with load.open(cache_path) as f:
+        return _fast_parse(f.read(), timescale)
+
+
+def _fast_parse(data: bytes, timescale: Timescale) -> dict[str, EarthSatellite]:
+    """
+    Parse TLE data into satellites - follows the same rules as skyfield's parse_tle_file, where a TLE is a pair of
+    lines starting with "1 " and "2 " optionally preceded by a name line, but constructs the satellites in bulk.
+    Building each satellite's epoch is the dominant cost of parse_tle_file so the epochs are converted in a single
+    vectorized timescale call.
+
+    :param data: The contents of a TLE file.
+    :param timescale: A Timescale object.
+    :return: A dictionary of EarthSatellite objects keyed by their name.
+    """
+    names = []
+    lines = []
+    satrecs = []
+    b0 = b1 = b""
+    for b2 in data.splitlines():
+        if (
+            b2.startswith(b"2 ")
+            and len(b2) >= 69
+            and b1.startswith(b"1 ")
+            and len(b1) >= 69
+        ):
+            name = b0.rstrip(b" ")
+            if name.startswith(b"0 "):
+                name = name[2:]  # Spacetrack 3-line format
+            names.append(name.decode("ascii").strip() if name else None)
+            lines.append((b1.decode("ascii"), b2.decode("ascii")))
+            satrecs.append(Satrec.twoline2rv(*lines[-1]))
+            b0 = b1 = b""  # don't accidentally use line 2 as the next satellite's name
+        else:
+            b0, b1 = b1, b2
+
+    if not satrecs:
+        return {}
+
+    # the same epoch calculation as EarthSatellite, for every satellite at once
+    years = np.array([satrec.epochyr for satrec in satrecs])
+    years += np.where(years < 57, 2000, 1900)
+    epochs = timescale.utc(years, 1, np.array([satrec.epochdays for satrec in satrecs]))
+
+    # the satellites are built without EarthSatellite.__init__ so they can share the epochs - check the first one
+    # against a satellite built normally in case this version of skyfield sets up satellites differently
+    if not hasattr(EarthSatellite, "_setup") or not _matches_earth_satellite(
+        _build_satellite(names[0], satrecs[0], epochs[0]), *lines[0], timescale
+    ):
+        log.warning(
+            "Unable to build satellites in bulk with this version of skyfield - falling back to EarthSatellite."
+        )
+        return {
+            name: EarthSatellite(line1, line2, name, timescale)
+            for name, (line1, line2) in zip(names, lines)
+        }
+
+    satellites = {}
+    for ii, (name, satrec) in enumerate(zip(names, satrecs)):
+        satellites[name] = _build_satellite(name, satrec, epochs[ii])
+    return satellites
+
+
+def _build_satellite(name: str | None, satrec: Satrec, epoch: Time) -> EarthSatellite:
+    """
+    Build a satellite the same way as EarthSatellite.__init__, but with an already calculated epoch.
+
+    :param name: The name of the satellite.
+    :param satrec: The parsed TLE.
+    :param epoch: The epoch of the TLE.
+    :return: The EarthSatellite object.
+    """
+    sat = EarthSatellite.__new__(EarthSatellite)
+    sat.name = name
+    sat.model = satrec
+    sat.epoch = epoch
+    sat._setup(satrec)
+    return sat
+
+
+def _matches_earth_satellite(
+    sat: EarthSatellite, line1: str, line2: str, timescale: Timescale
+) -> bool:
+    """
+    Check a satellite built by _build_satellite has the same attributes, epoch and position as one built by
+    EarthSatellite from the same TLE lines.
+
+    :param sat: The satellite built by _build_satellite.
+    :param line1: The first TLE line.
+    :param line2: The second TLE line.
+    :param timescale: A Timescale object.
+    :return: True if the satellites match.
+    """
+    expected = EarthSatellite(line1, line2, sat.name, timescale)
+    return (
+        vars(sat).keys() == vars(expected).keys()
+        and sat.name == expected.name
+        and sat.epoch.tt == expected.epoch.tt
+        and np.array_equal(
+            sat.at(expected.epoch).position.km, expected.at(expected.epoch).position.km
+        )
+    )
+
+
+def load_single_satellite(
+    timescale: Timescale, cache_path: pathlib.Path, group: CelestrakGroup, name: str
+) -> EarthSatellite | None:
+    """
+    Load a single satellite from Celestrak without parsing every satellite in the group.
+
+    :param timescale: A Timescale object.
+    :param cache_path: The path to the local cache file.
+    :param group: The Celestrak group to search.
+    :param name: The name of the satellite to load.
+    :return: The EarthSatellite object, or None if the satellite isn't in the group.
+    """
+    log.info(f"Searching satellite data group {group.name} for '{name}'...")
+
+    # a blank name can't match a name line
+    if not name.strip():
+        return None
+
+    cache_path = str(cache_path)
+    _checked_celestrak_cache(cache_path, group)
+    if os.path.getsize(cache_path) == 0:
+        return None
+
+    # search from the end of the file - like the dict returned by load_celestrak_data, the last TLE for a name wins
+    target = name.encode()
+    with (
+        open(cache_path, "rb") as f,
+        mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm,
+    ):
+        pos = mm.rfind(target)
+        while pos != -1:
+            # only accept a match on a whole name line - Celestrak pads the names with trailing spaces
+            end = mm.find(b"\n", pos)
+            if end == -1:
+                end = len(mm)
+            at_line_start = pos == 0 or mm[pos - 1] == ord("\n")
+            if at_line_start and not mm[pos + len(target) : end].strip():
+                # the two element lines immediately follow the name line - they must pass the same checks as
+                # _fast_parse uses
+                mm.seek(min(end + 1, len(mm)))
+                line1 = mm.readline().rstrip(b"\r\n")
+                line2 = mm.readline().rstrip(b"\r\n")
+                if (
+                    line1.startswith(b"1 ")
+                    and len(line1) >= 69
+                    and line2.startswith(b"2 ")
+                    and len(line2) >= 69
+                ):
+                    log.info(f"Found '{name}' in satellite data group {group.name}.")
+                    return EarthSatellite(
+                        line1.decode("ascii"), line2.decode("ascii"), name, timescale
+                    )
+            if pos == 0:
+                break
+            pos = mm.rfind(target, 0, pos + len(target) - 1)
+
+    log.info(f"Could not find '{name}' in satellite data group {group.name}.")
+    return None
 
 
 def load_stations_data(timescale: Timescale) -> dict[str, EarthSatellite]:
@@ -92,6 +345,45 @@ def load_active_data(timescale: Timescale) -> dict[str, EarthSatellite]:
     return load_celestrak_data(timescale, ACTIVE_FILE, CelestrakGroup.ACTIVE)
 
 
+def load_stations_satellite(timescale: Timescale, name: str) -> EarthSatellite | None:
+    """
+    Load a single satellite from the Celestrak stations data.
+
+    :param timescale: A Timescale object.
+    :param name: The name of the satellite to load.
+    :return: The EarthSatellite object, or None if the satellite isn't a station.
+    """
+    return load_single_satellite(
+        timescale, STATIONS_FILE, CelestrakGroup.STATIONS, name
+    )
+
+
+def load_active_satellite(timescale: Timescale, name: str) -> EarthSatellite | None:
+    """
+    Load a single satellite from the Celestrak active data.
+
+    :param timescale: A Timescale object.
+    :param name: The name of the satellite to load.
+    :return: The EarthSatellite object, or None if the satellite isn't active.
+    """
+    return load_single_satellite(timescale, ACTIVE_FILE, CelestrakGroup.ACTIVE, name)
+
+
+def load_satellite(timescale: Timescale, name: str) -> EarthSatellite | None:
+    """
+    Load a single satellite from Celestrak, checking the stations data first and only falling back to the much
+    larger active data if the satellite isn't a station.
+
+    :param timescale: A Timescale object.
+    :param name: The name of the satellite to load.
+    :return: The EarthSatellite object, or None if the satellite can't be found.
+    """
+    satellite = load_stations_satellite(timescale, name)
+    if satellite is None:
+        satellite = load_active_satellite(timescale, name)
+    return satellite
+
+
 def init_telescope(
     conf: Config, set_location=False, set_time=False
 ) -> NexStarHandControl:
@@ -123,13 +415,47 @@ def init_telescope(
 
     # set the time
     if set_time:
-        dt = datetime.datetime.now(tz=zoneinfo.ZoneInfo(conf.datetime.timezone))
+        dt = datetime.datetime.now(tz=conf.datetime.zoneinfo)
         log.info(f"Setting time to {dt}")
         hc.set_time(dt)
 
     return hc
 
 
+@functools.lru_cache(maxsize=8)
+def _trajectory_times(
+    ts: Timescale, start: datetime.datetime, duration: int, step: int
+) -> tuple[Time, np.ndarray]:
+    """
+    Create the range of times for a trajectory, ready for computing positions - the results are cached so repeated
+    trajectories over the same period (e.g. re-plans or other satellites) reuse the same Time object along with its
+    precomputed rotations.
+
+    :param ts: the timescale object
+    :param start: the utc start time of the trajectory
+    :param duration: the duration of the trajectory in seconds
+    :param step: the time between each point in seconds
+    :return: the Time object and the (read only) time offsets in seconds relative to the start time
+    """
+    rel_times = np.arange(0, duration, step, dtype=float)
+    rel_times.flags.writeable = False
+
+    # only the start time needs a calendar conversion, the rest of the range is offset from its julian date (keeping
+    # the whole and fractional days separate to preserve the precision)
+    t0 = ts.utc(
+        start.year, start.month, start.day, start.hour, start.minute, start.second
+    )
+    tr = ts.tt_jd(t0.whole, t0.tt_fraction + rel_times / 86400.0)
+
+    # skyfield uses the expensive IAU 2000A nutation model by default - IAU 2000B is accurate to about a milliarcsecond
+    # which is well under the pointing resolution of the telescope, so precompute the cheaper angles and populate the
+    # cached rotations on the shared time range before computing any positions
+    tr._nutation_angles = iau2000b(tr.tt)
+    _ = tr.M, tr.MT, tr.gast
+
+    return tr, rel_times
+
+
 def generate_trajectory(
     satellite: EarthSatellite,
     obs_location: GeographicPosition,
@@ -138,6 +464,7 @@ def generate_trajectory(
     tz: zoneinfo.ZoneInfo,
     max_slew_rate: float,
     plot_trajectory: bool,
+    plot_dir: pathlib.Path | None = None,
 ) -> MininumTrajectory:
     """
     Generate a minimum trajectory for the satellite.
@@ -149,104 +476,80 @@ def generate_trajectory(
     :param tz: the timezone object of the observer
     :param max_slew_rate: the maximum slew rate of the telescope
     :param plot_trajectory: whether to plot the trajectory
+    :param plot_dir: a directory to save the plots to instead of showing them, e.g. for headless runs
     :return: the minimum trajectory object
+    :raises RuntimeError: If the trajectory requires a slew rate faster than the telescope can move.
     """
-    # convert to utc and create a range of times
-    start = tracking_config.start.astimezone(zoneinfo.ZoneInfo("UTC"))
+    # only check the log level once - the sample and trajectory dumps below are skipped entirely unless debugging
+    debug_enabled = log.isEnabledFor(logging.DEBUG)
+
+    # convert to utc and create a range of times - use a relative time offset so we can do dryruns from an arbitrary
+    # start time
+    start = tracking_config.start.astimezone(UTC)
     step = tracking_config.trajectory.step
-    tr = ts.utc(
-        start.year,
-        start.month,
-        start.day,
-        start.hour,
-        start.minute,
-        range(start.second, start.second + tracking_config.get_duration_seconds, step),
+    tr, rel_times = _trajectory_times(
+        ts, start, tracking_config.get_duration_seconds, step
     )
 
     diff = satellite - obs_location
     alt, az, _ = diff.at(tr).altaz()
-    lti, lalt, laz = None, None, None
-
-    # to generate a smooth trajectory...
-    points = []
-    rates = []
-    times = []
-
-    traj_start = tr[0].utc_datetime()
-    for ti, a, z in zip(tr, alt.degrees, az.degrees):
-        # print the event time in local time
-        event_time = ti.utc_datetime().astimezone(tz)
-
-        # calculate the rate of change of alt/az in arcseconds per second
-        # this is just to see if my telescope can keep up
-        if lalt is not None:
-            dalt = a - lalt
-
-            # need to detect when the satellite crosses the 0/360° boundary for azimuth - but not for altitude since
-            #  we won't be observing any objects below the horizon
-            zfp = z  # zfp for printing to the log...but for trajectory generation we may need to adjust for crossing
-            if abs(laz - z) > 180:
-                if laz > z:
-                    zfp = z - laz + 360
-                    z += 360  # trajectory generation requires a continuous trajectory
-                else:
-                    zfp = z - laz - 360
-                    z -= 360  # trajectory generation requires a continuous trajectory
-            daz = z - laz
-            dt = (event_time - lti).seconds
-            alt_slew_rate = dalt / dt * 3600
-            az_slew_rate = daz / dt * 3600
-
-            # make sure the slew rate is within the limits of the telescope
-            assert (
-                abs(alt_slew_rate) <= max_slew_rate
-            ), f"Calcualted impossible slew rate for altitude! {alt_slew_rate} > {max_slew_rate}"
-            assert (
-                abs(az_slew_rate) <= max_slew_rate
-            ), f"Calcualted impossible slew rate for azimuth! {az_slew_rate} > {max_slew_rate}"
-
-            if log.isEnabledFor(logging.DEBUG):
+    alt_deg = alt.degrees
+
+    # need to detect when the satellite crosses the 0/360° boundary for azimuth - but not for altitude since we won't
+    # be observing any objects below the horizon - trajectory generation requires a continuous trajectory
+    az_deg = np.unwrap(az.degrees, period=360)
+
+    # to generate a smooth trajectory... the points and times are sized with room for an extra point at the beginning
+    # and end of the satellite samples
+    num_samples = len(rel_times)
+    points = np.empty((num_samples + 2, 2))
+    points[1:-1, 0] = alt_deg
+    points[1:-1, 1] = az_deg
+    times = np.empty(num_samples + 2)
+    times[1:-1] = rel_times
+
+    # calculate the rate of change of alt/az in arcseconds per second - the samples are exactly one step apart
+    # this is just to see if my telescope can keep up
+    rates = np.diff(points[1:-1], axis=0) / step * 3600
+
+    # make sure the slew rates are within the limits of the telescope - one check over all the rates, and find the
+    # offending sample only if it fails
+    abs_rates = np.abs(rates)
+    if abs_rates.max() > max_slew_rate:
+        ii, axis = np.unravel_index(np.argmax(abs_rates), abs_rates.shape)
+        raise RuntimeError(
+            f"Calculated impossible slew rate for {('altitude', 'azimuth')[axis]} between samples {ii} and {ii + 1} "
+            f"(at {rel_times[ii]} seconds)! {abs_rates[ii, axis]} > {max_slew_rate}"
+        )
+
+    if debug_enabled:
+        # print the event times in local time
+        event_times = tr.astimezone(tz)
+        for ii, (event_time, a, z) in enumerate(zip(event_times, alt_deg, az.degrees)):
+            if ii == 0:  # first point - no rate of change
                 log.debug(
-                    f"{event_time.strftime('%Y-%m-%d %H:%M:%S %Z')} alt: {a:.5f}°, az: {zfp:.5f}°, "
-                    f"alt rate: {dalt / dt * 3600:.5f}″/s, az rate: {daz / dt * 3600:.5f}″/s"
+                    f"{event_time.strftime('%Y-%m-%d %H:%M:%S %Z')} alt: {a:.5f}°, az: {z:.5f}°"
                 )
-            rates.append((alt_slew_rate, az_slew_rate))
-        else:  # first point - no rate of change
-            if log.isEnabledFor(logging.DEBUG):
+            else:
+                alt_slew_rate, az_slew_rate = rates[ii - 1]
                 log.debug(
-                    f"{event_time.strftime('%Y-%m-%d %H:%M:%S %Z')} alt: {a:.5f}°, az: {z:.5f}°"
+                    f"{event_time.strftime('%Y-%m-%d %H:%M:%S %Z')} alt: {a:.5f}°, az: {z:.5f}°, "
+                    f"alt rate: {alt_slew_rate:.5f}″/s, az rate: {az_slew_rate:.5f}″/s"
                 )
 
-        points.append((a, z))
-
-        # use a relative time offset so we can do dryruns from an arbitrary start time
-        times.append(ti.utc_datetime().timestamp() - traj_start.timestamp())
-
-        # cache the points and times for the next loop so we can calculate the rate of change
-        lti, lalt, laz = event_time, a, z
-
     # we want the first and last points to have a non-zero velocity, so we can add one extra point and time at the
     # beginning and end that we can calculate (i.e. the telescope will be stationary at these padded points, but have
     # a velocity closer to the satellites velocity in the sky)
-    start_alt_delta = points[1][0] - points[0][0]
-    start_az_delta = points[1][1] - points[0][1]
-    start_alt_delta *= tracking_config.trajectory.offset_multiplier
-    start_az_delta *= tracking_config.trajectory.offset_multiplier
-
-    points.insert(0, (points[0][0] - start_alt_delta, points[0][1] - start_az_delta))
+    offset_multiplier = tracking_config.trajectory.offset_multiplier
+    points[0] = points[1] - (points[2] - points[1]) * offset_multiplier
 
     # insert a negative time that is larger than the step size so that the telescope can smoothly ramp up
     pad = tracking_config.trajectory.pad
-    times.insert(0, times[0] - pad)
+    times[0] = times[1] - pad
 
     # lets do the end point as well - the velocity at the end point should be non-zero
-    end_alt_delta = points[-1][0] - points[-2][0]
-    end_az_delta = points[-1][1] - points[-2][1]
-    end_alt_delta *= tracking_config.trajectory.offset_multiplier
-    end_az_delta *= tracking_config.trajectory.offset_multiplier
-
-    points.append((points[-1][0] + end_alt_delta, points[-1][1] + end_az_delta))
-    times.append(times[-1] + pad)
+    points[-1] = points[-2] + (points[-2] - points[-3]) * offset_multiplier
+    times[-1] = times[-2] + pad
 
     # create a new minimum trajectory
     log.info("Generating minimum trajectory...")
@@ -255,42 +558,43 @@ def generate_trajectory(
     log.info("Minimum trajectory generated successfully.")
 
     if plot_trajectory:
-        # use matplotlib to plot the input points and the generated trajectory
-        plottimes = np.linspace(times[0], times[-1], len(times) * 10)
+        plt = _load_pyplot(plot_dir)
+
+        # use matplotlib to plot the input points and the generated trajectory - the trajectory is evaluated once and
+        # shared by both figures
+        plottimes = np.linspace(times[0], times[-1], len(times) * PLOT_OVERSAMPLING)
+        plotvals = traj.getvalues_batch(plottimes)
 
         fig, ax = plt.subplots()
+        ax.plot(points[:, 1], points[:, 0], "rx", label="input points")
         ax.plot(
-            [p[1] for p in points], [p[0] for p in points], "rx", label="input points"
-        )
-        ax.plot(
-            [traj.getvalues(t)[1][0] for t in plottimes],
-            [traj.getvalues(t)[0][0] for t in plottimes],
+            plotvals[:, 1, 0],
+            plotvals[:, 0, 0],
             "b-",
             label="trajectory",
         )
         ax.set_xlabel("azimuth (°)")
         ax.set_ylabel("altitude (°)")
         ax.legend()
-        plt.show()
+        _show_plot(plt, fig, plot_dir, "trajectory")
 
         # plot the az/alt rates of change as well for the input points
         fig, ax = plt.subplots()
-        ax.plot([p[1] for p in rates], [p[0] for p in rates], "rx", label="input rates")
+        ax.plot(rates[:, 1], rates[:, 0], "rx", label="input rates")
         ax.plot(
-            [traj.getvalues(t)[1][1] * 3600 for t in plottimes],
-            [traj.getvalues(t)[0][1] * 3600 for t in plottimes],
+            plotvals[:, 1, 1] * 3600,
+            plotvals[:, 0, 1] * 3600,
             "b-",
             label="trajectory",
         )
         ax.set_xlabel('azimuth rate ("/s)')
         ax.set_ylabel('altitude rate ("/s)')
         ax.legend()
-        plt.show()
+        _show_plot(plt, fig, plot_dir, "trajectory-rates")
 
         # double check our work if in debug mode
-        if log.isEnabledFor(logging.DEBUG):
-            for t in plottimes:
-                vals = traj.getvalues(t)
+        if debug_enabled:
+            for t, vals in zip(plottimes, plotvals):
                 x = vals[0][0]
                 y = vals[1][0]
 
@@ -304,11 +608,50 @@ def generate_trajectory(
     return traj
 
 
+def _load_pyplot(plot_dir: pathlib.Path | None):
+    """
+    Import matplotlib's pyplot - matplotlib is slow to import, so we only load it when we actually plot.
+
+    :param plot_dir: the directory plots will be saved to, or None if they will be shown
+    :return: the matplotlib.pyplot module
+    """
+    import matplotlib
+
+    if plot_dir is not None:
+        # plots are only saved to files, so there is no need for a GUI backend
+        matplotlib.use("Agg")
+
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def _show_plot(plt, fig, plot_dir: pathlib.Path | None, name: str) -> None:
+    """
+    Show a plot, or save it to a file if a plot directory is set.
+
+    :param plt: the matplotlib.pyplot module
+    :param fig: the figure to show
+    :param plot_dir: the directory to save the plot to, or None to show the plot
+    :param name: the file name (without extension) to save the plot as
+    """
+    if plot_dir is None:
+        plt.show()
+        return
+
+    plot_dir.mkdir(parents=True, exist_ok=True)
+    path = plot_dir / f"{name}.png"
+    log.info(f"Saving plot to {path}")
+    fig.savefig(path)
+    plt.close(fig)
+
+
 def track_satellite(
     hc: NexStarHandControl,
     traj: MininumTrajectory,
     tracking_config: TrackingConfig,
     is_dryrun: bool,
+    plot_dir: pathlib.Path | None = None,
 ) -> None:
     """
     Track the satellite along the trajectory.
@@ -317,6 +660,7 @@ def track_satellite(
     :param traj: the minimum trajectory object
     :param tracking_config: the tracking configuration object
     :param is_dryrun: a dry run will move the telescope but won't wait for the start time - useful for debugging
+    :param plot_dir: a directory to save the positional error plot to instead of showing it, e.g. for headless runs
     """
 
     # move to the start location
@@ -332,10 +676,17 @@ def track_satellite(
 
     pad = tracking_config.trajectory.pad
 
+    # evaluate the whole trajectory on a fine grid before we start so the control loop only has to look up the
+    # values for the current time - the lookup table covers the trajectory duration and 2x the pad time
+    lut_times = np.arange(
+        -pad, tracking_config.get_duration_seconds + pad, 1 / TRACKING_LUT_RATE
+    )
+    lut_vals = traj.getvalues_batch(lut_times, jit=True)
+
     # if this isn't a dryrun, we need to wait until the start time
     if not is_dryrun:
-        start = tracking_config.start.astimezone(zoneinfo.ZoneInfo("UTC"))
-        now = datetime.datetime.now(tz=zoneinfo.ZoneInfo("UTC"))
+        start = tracking_config.start.astimezone(UTC)
+        now = datetime.datetime.now(tz=UTC)
 
         delta = start - now
         log.info(f"Satellite tracking starts in {delta.total_seconds()} seconds...")
@@ -350,8 +701,8 @@ def track_satellite(
     else:
         log.info("This is a dryrun - telescope will move along trajectory immediately")
 
-    # stamp our start time
-    start_time = time.time()
+    # stamp our start time - the loop runs on the monotonic clock so system clock adjustments can't disturb it
+    start_time = time.monotonic()
 
     # start tracking
     log.info("Starting satellite tracking...")
@@ -360,8 +711,6 @@ def track_satellite(
     current_tracking_mode = hc.get_tracking_mode()
     hc.set_tracking_mode(TrackingMode.OFF)
 
-    # we'll track the positional error occasionally so we can plot it afterwords
-    pos_error: list[tuple[float, tuple[float, float]]] = []
     period = tracking_config.tracking_period
     try:
         # main loop - we exit once the duration is reached - duration is the original trajectory
@@ -380,15 +729,30 @@ def track_satellite(
         # is more important and fetching current position adds a round trip to the telescope
         num_loops_for_log = round(1 / period)
 
-        while time.time() - start_time < duration:
-            op_start = time.time()
+        # we'll track the positional error occasionally so we can plot it afterwords - preallocate room for every
+        # logged loop (plus a few to spare)
+        max_num_errors = int(duration / period) // num_loops_for_log + 8
+        pos_error_t = np.empty(max_num_errors)
+        pos_error_xy = np.empty((max_num_errors, 2))
+        num_errors = 0
+
+        while time.monotonic() - start_time < duration:
+            op_start = time.monotonic()
+
+            # every loop has an absolute deadline so timing jitter doesn't accumulate over the trajectory
+            deadline = start_time + (loop_counter + 1) * period
 
             # get the current relative time - this will be negative at first to account for padding
             rt = op_start - padded_start_time
 
             # get the azimuth and altitude velocities from the trajectory for the current time
             # and convert to arcseconds per second
-            vals = traj.getvalues(rt)
+            # interpolate between the lookup table entries either side of the current time
+            lut_pos = min(max((rt + pad) * TRACKING_LUT_RATE, 0), len(lut_vals) - 1)
+            lut_idx = min(int(lut_pos), len(lut_vals) - 2)
+            vals = lut_vals[lut_idx] + (lut_vals[lut_idx + 1] - lut_vals[lut_idx]) * (
+                lut_pos - lut_idx
+            )
             azm_rate = round(vals[1][1] * 3600)
             alt_rate = round(vals[0][1] * 3600)
 
@@ -397,34 +761,30 @@ def track_satellite(
 
             # we throttle the error logging because we will get more accuracy with more frequent
             # rate updates
-            if loop_counter % num_loops_for_log == 0:
+            if loop_counter % num_loops_for_log == 0 and num_errors < max_num_errors:
                 # determine the error between the expected and actual positions
                 azm, alt = hc.get_position_azm_alt()
 
-                # handle case when azimuth crosses 0/360° boundary
-                if abs(lazm - azm) > 180:
-                    if lazm > azm:
-                        azm += 360
-                    else:
-                        azm -= 360
-                pos_error.append((rt, (vals[1][0] - azm, vals[0][0] - alt)))
+                # handle case when azimuth crosses 0/360° boundary - shifts by a full turn whenever the change from
+                # the last azimuth is more than half a turn
+                azm += 360 * round((lazm - azm) / 360)
+                pos_error_t[num_errors] = rt
+                pos_error_xy[num_errors] = vals[1][0] - azm, vals[0][0] - alt
+                num_errors += 1
                 lazm = azm
 
             # log a progress message occasionally
             if loop_counter % num_loops_for_progress == 0:
                 log.info(f"Progress: {((rt + pad) / duration) * 100:.1f}%")
 
-            # detect if the operations took longer than the period
-            op_end = time.time()
-            op_duration = op_end - op_start
-            if op_duration > period:
+            # sleep until the next loop, detecting if the operations took longer than the period
+            sleep_duration = deadline - time.monotonic()
+            if sleep_duration > 0:
+                time.sleep(sleep_duration)
+            else:
                 log.warning(
                     "Operation took longer than the period - consider increasing the period"
                 )
-
-            # sleep until next loop
-            if op_duration < period:
-                time.sleep(period - op_duration)
             loop_counter += 1
     finally:
         # stop slewing and restore the tracking mode no matter what
@@ -433,20 +793,21 @@ def track_satellite(
         hc.set_tracking_mode(current_tracking_mode)
 
     # plot the positional errors over time
+    plt = _load_pyplot(plot_dir)
     fig, ax = plt.subplots()
     ax.plot(
-        [p[0] for p in pos_error],
-        [p[1][0] for p in pos_error],
+        pos_error_t[:num_errors],
+        pos_error_xy[:num_errors, 0],
         "r-",
         label="azimuth error",
     )
     ax.plot(
-        [p[0] for p in pos_error],
-        [p[1][1] for p in pos_error],
+        pos_error_t[:num_errors],
+        pos_error_xy[:num_errors, 1],
         "b-",
         label="altitude error",
     )
     ax.set_xlabel("time (s)")
     ax.set_ylabel("error (°)")
     ax.legend()
-    plt.show()
+    _show_plot(plt, fig, plot_dir, "tracking-error")